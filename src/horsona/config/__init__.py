@@ -1,3 +1,4 @@
+import os
 from typing import TYPE_CHECKING
 
 from horsona.config.json_with_comments import load_json_with_comments
@@ -45,6 +46,14 @@ def load_llms() -> dict[str, "AsyncLLMEngine"]:
 
     llms.clear()
 
+    # Serve repeated queries from disk, e.g. for repeated test runs
+    if os.environ.get("HORSONA_LLM_CACHE"):
+        from horsona.llm.cached_engine import CachedLLMEngine
+
+        cache_dir = os.environ.get("HORSONA_LLM_CACHE_DIR", ".llmcache")
+    else:
+        cache_dir = None
+
     # Create engine instances based on config
     for item in config:
         for name, params in item.items():
@@ -95,6 +104,14 @@ def load_llms() -> dict[str, "AsyncLLMEngine"]:
             else:
                 raise ValueError(f"Unknown engine type: {engine_type}")
 
+            # Wrap engines before any MultiEngine or ReferenceEngine uses them,
+            # so queries through those are cached too
+            if cache_dir is not None and engine_type not in (
+                "MultiEngine",
+                "ReferenceEngine",
+            ):
+                llms[name] = CachedLLMEngine(llms[name], cache_dir, name=name)
+
     _loaded_llms = True
     return llms
 
@@ -1,2 +1,2 @@
 from .api_routes import api_router
-from .node_graph_api import configure, skipped_functions
+from .node_graph_api import NodeGraphRegistry, configure, skipped_functions
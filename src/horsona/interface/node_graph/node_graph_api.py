@@ -10,24 +10,26 @@ from contextlib import asynccontextmanager
 from inspect import signature
 from time import time
 from types import NoneType, UnionType
+from typing import AsyncGenerator, Callable
 from uuid import uuid4
 
-from fastapi import APIRouter, Body, FastAPI, HTTPException, Request, status
+from fastapi import (
+    APIRouter,
+    Body,
+    Depends,
+    FastAPI,
+    HTTPException,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
 
 from horsona.autodiff.basic import HorseData, HorseVariable
 
 from .node_graph_models import *
 
-# In-memory storage for sessions and resources
-_sessions: dict[str, "Session"] = {}
-_session_cleanup_interval = 60
-_session_timeout = 300
-_session_cleanup_task = None
-_allowed_modules_regex = re.compile(r"^(horsona\..*)$")
-_allowed_modules: list[str] = []
-_allowed_module_names: set[str] = set()
-skipped_functions: set[str] = set()
-
 
 class Resource(BaseModel):
     id: int
@@ -36,18 +38,176 @@ class Resource(BaseModel):
     result_obj: Any
 
 
+# Incremented whenever a request may have changed any object. Objects like LLM
+# engines are shared across sessions and registries, so cached response bodies
+# are keyed by this process-wide counter and the session's resource count.
+_mutation_counter = 0
+
+
 class Session(BaseModel):
     id: str
     resource_id_to_node: dict[int, Resource] = {}
     resource_obj_to_node: dict[Any, Resource] = {}
     last_active: float
+    cache_key: Optional[tuple[int, int]] = None
+    list_resources_cache: Optional[bytes] = None
+    resource_cache: dict[int, bytes] = {}
+
+    def refresh_caches(self) -> None:
+        # Drop every cached body as soon as the key changes so stale bodies don't
+        # accumulate
+        cache_key = (_mutation_counter, len(self.resource_id_to_node))
+        if cache_key != self.cache_key:
+            self.cache_key = cache_key
+            self.list_resources_cache = None
+            self.resource_cache = {}
+
+
+class NodeGraphRegistry:
+    """
+    In-memory storage for the sessions, resources, and configuration of a NodeGraphAPI.
+
+    Routes use the registry stored in `app.state.node_graph` if one is set, and the
+    module-level default registry (updated by `configure`) otherwise.
+    """
+
+    def __init__(self):
+        self.sessions: dict[str, Session] = {}
+        self.session_timeout: float = 300
+        self.session_cleanup_interval: float = 60
+        self.session_cleanup_task: Optional[asyncio.Task] = None
+        self.clock: Callable[[], float] = time
+        self.allowed_modules: set[types.ModuleType] = set()
+        self.allowed_module_names: set[str] = set()
+        self.skipped_functions: set[str] = set()
+        self.current_config: Optional[tuple[float, float, frozenset[str]]] = None
+        self.openapi_spec: Optional[dict] = None
+
+    def configure(
+        self,
+        session_timeout: float = 300,
+        session_cleanup_interval: float = 60,
+        extra_modules: list[str] = [],
+        clock: Callable[[], float] = time,
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            session_timeout (float): The time in seconds after which an inactive session will be removed. Default is 300 seconds.
+            session_cleanup_interval (float): The interval in seconds between session cleanup checks. Default is 60 seconds.
+            extra_modules (List[str]): A list of additional module names to allow. Default is an empty list.
+            clock (Callable[[], float]): The function used to read the current time in seconds. Default is time.time.
+        """
+        for session_id in list(self.sessions.keys()):
+            self.remove_session(session_id)
+        self.clock = clock
+
+        # Reconfiguring with the same arguments keeps the module scan and the
+        # running cleanup task
+        config = (session_timeout, session_cleanup_interval, frozenset(extra_modules))
+        if config == self.current_config:
+            return
+
+        self.session_timeout = session_timeout
+        self.session_cleanup_interval = session_cleanup_interval
+        self.skipped_functions.clear()
+        self.openapi_spec = None
+        self.allowed_module_names = set()
+        self.allowed_modules = set()
+        for parent_module_name in ["horsona", *extra_modules]:
+            module = importlib.import_module(parent_module_name)
+            self.allowed_modules.add(module)
+            self.allowed_module_names.add(parent_module_name)
+            if hasattr(module, "__path__"):
+                for loader, module_name, is_pkg in pkgutil.walk_packages(
+                    module.__path__, parent_module_name + "."
+                ):
+                    self.allowed_modules.add(importlib.import_module(module_name))
+                    self.allowed_module_names.add(module_name)
+        # Only a completed scan is kept, so retrying after a failed import scans
+        # again
+        self.current_config = config
+        if self.session_cleanup_task is not None:
+            asyncio.create_task(self.reset_session_cleanup_task())
+
+    def remove_session(self, session_id: str):
+        """
+        Remove a session.
+
+        Args:
+            session_id (str): The ID of the session to remove.
+        """
+        del self.sessions[session_id]
+
+    async def start_session_cleanup_task(self):
+        """
+        Start the NodeGraphAPI by initializing the session cleanup task.
+        """
+        self.session_cleanup_task = asyncio.create_task(self.session_cleanup_loop())
+
+    async def stop_session_cleanup_task(self):
+        """
+        Stop the NodeGraphAPI by cancelling the session cleanup task.
+        """
+        if self.session_cleanup_task is not None:
+            self.session_cleanup_task.cancel()
+
+    async def reset_session_cleanup_task(self):
+        await self.stop_session_cleanup_task()
+        await self.start_session_cleanup_task()
+
+    async def session_cleanup_loop(self):
+        """
+        Periodically clean up timed-out sessions.
+        """
+        while True:
+            # Wait for the next cleanup
+            await asyncio.sleep(self.session_cleanup_interval)
+            self.cleanup_sessions()
+
+    def cleanup_sessions(self):
+        """
+        Remove every session that has been inactive for longer than the session timeout.
+        """
+        current_time = self.clock()
+        sessions_to_remove = [
+            session_id
+            for session_id, session in self.sessions.items()
+            if current_time - session.last_active > self.session_timeout
+        ]
+
+        for session_id in sessions_to_remove:
+            self.remove_session(session_id)
+
+
+def json_response(content: BaseModel | bytes) -> Response:
+    """
+    Serialize a response model with pydantic's JSON serializer, skipping FastAPI's
+    intermediate conversion to Python objects.
+    """
+    if isinstance(content, BaseModel):
+        content = content.model_dump_json()
+    return Response(content=content, media_type="application/json")
+
+
+_default_registry = NodeGraphRegistry()
+skipped_functions: set[str] = _default_registry.skipped_functions
+
+
+def get_registry(request: Request) -> NodeGraphRegistry:
+    """
+    Get the registry used by the app handling a request.
+    """
+    return getattr(request.app.state, "node_graph", _default_registry)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await start_session_cleanup_task()
+    registry: NodeGraphRegistry = getattr(app.state, "node_graph", _default_registry)
+    await registry.start_session_cleanup_task()
     yield
-    await stop_session_cleanup_task()
+    await registry.stop_session_cleanup_task()
 
 
 router = APIRouter(prefix="/api", lifespan=lifespan)
@@ -57,6 +217,7 @@ def configure(
     session_timeout: float = 300,
     session_cleanup_interval: float = 60,
     extra_modules: list[str] = [],
+    clock: Callable[[], float] = time,
 ):
     """
     Initialize the NodeGraphAPI.
@@ -65,38 +226,14 @@ def configure(
         session_timeout (float): The time in seconds after which an inactive session will be removed. Default is 300 seconds.
         session_cleanup_interval (float): The interval in seconds between session cleanup checks. Default is 60 seconds.
         extra_modules (List[str]): A list of additional module names to allow. Default is an empty list.
+        clock (Callable[[], float]): The function used to read the current time in seconds. Default is time.time.
     """
-    global \
-        _sessions, \
-        _session_timeout, \
-        _session_cleanup_interval, \
-        _session_cleanup_task, \
-        _allowed_modules, \
-        _allowed_module_names, \
-        _allowed_modules_regex, \
-        skipped_functions
-
-    _sessions = {}
-    _session_timeout = session_timeout
-    _session_cleanup_interval = session_cleanup_interval
-    _allowed_modules_regex = re.compile(
-        (r"^(" + "|".join([rf"{x}$|{x}\..*$" for x in _allowed_modules]) + ")")
+    _default_registry.configure(
+        session_timeout=session_timeout,
+        session_cleanup_interval=session_cleanup_interval,
+        extra_modules=extra_modules,
+        clock=clock,
     )
-    skipped_functions.clear()
-    _allowed_module_names = set()
-    _allowed_modules = set()
-    for parent_module_name in ["horsona", *extra_modules]:
-        module = importlib.import_module(parent_module_name)
-        _allowed_modules.add(module)
-        _allowed_module_names.add(parent_module_name)
-        if hasattr(module, "__path__"):
-            for loader, module_name, is_pkg in pkgutil.walk_packages(
-                module.__path__, parent_module_name + "."
-            ):
-                _allowed_modules.add(importlib.import_module(module_name))
-                _allowed_module_names.add(module_name)
-    if _session_cleanup_task is not None:
-        asyncio.create_task(reset_session_cleanup_task())
 
 
 def _get_param_annotation(annotation) -> type:
@@ -174,11 +311,14 @@ class DependencyOverride:
     use_cache: bool = False
 
 
-def _create_route(app: FastAPI, path: str, method_obj: Any) -> dict[str, Any]:
+def _create_route(
+    registry: NodeGraphRegistry, app: FastAPI, path: str, method_obj: Any
+) -> dict[str, Any]:
     """
     Create a FastAPI route for a given method with appropriate argument types.
 
     Args:
+        registry: The registry whose allowed modules and skipped functions to use
         app: The FastAPI application to add the route to
         path: The URL path for the route
         method_obj: The method object to create a route for
@@ -216,7 +356,7 @@ def _create_route(app: FastAPI, path: str, method_obj: Any) -> dict[str, Any]:
                 new_annotations[param] = DictArgument
                 continue
             print(f"Skipping {path} due to missing annotation for parameter {param}")
-            skipped_functions.add(path)
+            registry.skipped_functions.add(path)
             return None
 
         # Convert annotation to Argument type
@@ -225,7 +365,7 @@ def _create_route(app: FastAPI, path: str, method_obj: Any) -> dict[str, Any]:
             print(
                 f"Skipping {path} due to unsupported annotation for parameter {param}"
             )
-            skipped_functions.add(path)
+            registry.skipped_functions.add(path)
 
             return None
 
@@ -235,7 +375,7 @@ def _create_route(app: FastAPI, path: str, method_obj: Any) -> dict[str, Any]:
     if "return" not in orig_annotations:
         if method_obj.__name__ != "__init__":
             print(f"Skipping {path} due to missing return annotation")
-            skipped_functions.add(path)
+            registry.skipped_functions.add(path)
             return None
         else:
             new_annotations["return"] = NodeArgument
@@ -254,7 +394,7 @@ def _create_route(app: FastAPI, path: str, method_obj: Any) -> dict[str, Any]:
     )
     args_name = "_".join(path.split("/")[-1].split("."))
     if args:
-        ns = {x.__name__: x for x in _allowed_modules}
+        ns = {x.__name__: x for x in registry.allowed_modules}
         ns.update(globals())
         exec(
             (
@@ -291,7 +431,7 @@ async def docs():
 
 
 @router.get("/openapi.json")
-async def get_openapi():
+async def get_openapi(registry: NodeGraphRegistry = Depends(get_registry)):
     """
     Generate OpenAPI specification for all allowed modules and their functions/methods.
 
@@ -303,16 +443,22 @@ async def get_openapi():
     2. Scans all allowed modules for functions and classes
     3. Creates routes for each function/method with appropriate type conversions
     4. Generates OpenAPI spec from the routes
+
+    The spec only depends on the allowed modules, so it's cached on the registry
+    until the registry is reconfigured.
     """
     import inspect
 
+    if registry.openapi_spec is not None:
+        return registry.openapi_spec
+
     from fastapi.openapi.utils import get_openapi
 
     # Create temporary FastAPI app to generate OpenAPI spec
     temp_app = FastAPI()
 
     # Scan all allowed modules
-    for module in _allowed_modules:
+    for module in registry.allowed_modules:
         # Get all functions and classes in module
         for name, obj in inspect.getmembers(module):
             if not hasattr(obj, "__module__"):
@@ -326,7 +472,7 @@ async def get_openapi():
             # Handle standalone functions
             if inspect.isfunction(obj) and not type(obj) == type:
                 path = f"{router.prefix}/sessions/{{session_id}}/resources/{module.__name__}/{name}"
-                _create_route(temp_app, path, obj)
+                _create_route(registry, temp_app, path, obj)
 
             # Handle classes and their methods
             elif inspect.isclass(obj):
@@ -334,7 +480,7 @@ async def get_openapi():
                     obj, predicate=inspect.isfunction
                 ):
                     path = f"{router.prefix}/sessions/{{session_id}}/resources/{module.__name__}/{name}.{method_name}"
-                    if method.__module__ not in _allowed_module_names:
+                    if method.__module__ not in registry.allowed_module_names:
                         continue
 
                     # Skip abstract methods
@@ -356,58 +502,20 @@ async def get_openapi():
                     if not hasattr(method, "__call__"):
                         continue
 
-                    _create_route(temp_app, path, method)
+                    _create_route(registry, temp_app, path, method)
 
-    return get_openapi(
+    registry.openapi_spec = get_openapi(
         title="Horsona Modules",
         version="0.1.0",
         routes=temp_app.routes,
     )
+    return registry.openapi_spec
 
 
-async def start_session_cleanup_task():
-    """
-    Start the NodeGraphAPI by initializing the session cleanup task.
-    """
-    global _session_cleanup_task
-
-    _session_cleanup_task = asyncio.create_task(session_cleanup_task())
-
-
-async def stop_session_cleanup_task():
-    """
-    Stop the NodeGraphAPI by cancelling the session cleanup task.
-    """
-    if _session_cleanup_task is not None:
-        _session_cleanup_task.cancel()
-
-
-async def reset_session_cleanup_task():
-    await stop_session_cleanup_task()
-    await start_session_cleanup_task()
-
-
-async def session_cleanup_task():
-    """
-    Periodically clean up timed-out sessions.
-    """
-    while True:
-        # Wait for the next cleanup
-        await asyncio.sleep(_session_cleanup_interval)
-
-        current_time = time()
-        sessions_to_remove = [
-            session_id
-            for session_id, session in _sessions.items()
-            if current_time - session.last_active > _session_timeout
-        ]
-
-        for session_id in sessions_to_remove:
-            del _sessions[session_id]
-
-
-async def execute(module_name, class_name, function_name, kwargs):
-    if module_name not in _allowed_module_names:
+async def execute(
+    registry: NodeGraphRegistry, module_name, class_name, function_name, kwargs
+):
+    if module_name not in registry.allowed_module_names:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Module not found"
         )
@@ -458,18 +566,20 @@ async def execute(module_name, class_name, function_name, kwargs):
 
 
 @router.get("/sessions", response_model=SessionListResponse)
-async def list_sessions() -> SessionListResponse:
+async def list_sessions(
+    registry: NodeGraphRegistry = Depends(get_registry),
+) -> SessionListResponse:
     """
     Get the list of running sessions.
 
     Returns:
         SessionListResponse: A response object containing the list of active sessions with their IDs, last active times, and remaining TTLs.
     """
-    current_time = time()
+    current_time = registry.clock()
     active_sessions = []
-    for session_id, session in _sessions.items():
+    for session_id, session in registry.sessions.items():
         last_active = session.last_active
-        remaining_ttl = max(0, _session_timeout - (current_time - last_active))
+        remaining_ttl = max(0, registry.session_timeout - (current_time - last_active))
         active_sessions.append(
             SessionInfo(
                 session_id=session_id,
@@ -492,7 +602,9 @@ async def root():
 
 
 @router.post("/sessions", response_model=CreateSessionResponse)
-async def create_session() -> CreateSessionResponse:
+async def create_session(
+    registry: NodeGraphRegistry = Depends(get_registry),
+) -> CreateSessionResponse:
     """
     Create a new session.
 
@@ -500,14 +612,16 @@ async def create_session() -> CreateSessionResponse:
         CreateSessionResponse: An object containing the new session ID and a success message.
     """
     session_id = str(uuid4())
-    _sessions[session_id] = Session(id=session_id, last_active=time())
+    registry.sessions[session_id] = Session(id=session_id, last_active=registry.clock())
     return CreateSessionResponse(
         session_id=session_id, message="Session created successfully"
     )
 
 
 @router.post("/sessions/{session_id}/keep_alive", response_model=KeepAliveResponse)
-async def keep_alive(session_id: str):
+async def keep_alive(
+    session_id: str, registry: NodeGraphRegistry = Depends(get_registry)
+):
     """
     Keep a session alive by updating its last active time.
 
@@ -520,16 +634,39 @@ async def keep_alive(session_id: str):
     Raises:
         HTTPException: If the session is not found.
     """
-    if session_id not in _sessions:
+    if session_id not in registry.sessions:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
         )
-    _sessions[session_id].last_active = time()
+    registry.sessions[session_id].last_active = registry.clock()
     return KeepAliveResponse(message="Session kept alive")
 
 
+# Sessions with more resources than this are listed as a stream instead of being
+# serialized and cached as one body
+STREAM_RESOURCES_THRESHOLD = 100
+
+# Argument types whose values are lists of arguments that can hold batch references
+BATCH_LIST_TYPES = (ArgumentType.LIST, ArgumentType.TUPLE, ArgumentType.SET)
+
+
+async def stream_resources(session: Session) -> AsyncGenerator[bytes, None]:
+    # Snapshot the nodes since requests can add resources while streaming
+    nodes = list(session.resource_id_to_node.values())
+
+    yield b'{"resources":['
+    for i, node in enumerate(nodes):
+        data, result = pack_result(session, [], node.result_obj, recurse=True)
+        if i > 0:
+            yield b","
+        yield ResourceResponse(result=result, data=data).model_dump_json().encode()
+    yield b"]}"
+
+
 @router.get("/sessions/{session_id}/resources", response_model=ListResourcesResponse)
-async def list_resources(session_id: str):
+async def list_resources(
+    session_id: str, registry: NodeGraphRegistry = Depends(get_registry)
+):
     """
     List all resources in a session.
 
@@ -542,25 +679,40 @@ async def list_resources(session_id: str):
     Raises:
         HTTPException: If the session is not found.
     """
-    if session_id not in _sessions:
+    if session_id not in registry.sessions:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
         )
 
-    resources = []
-    for node in _sessions[session_id].resource_id_to_node.values():
-        data, result = pack_result(session_id, [], node.result_obj, recurse=True)
-        resources.append(
-            ResourceResponse(
-                result=result,
-                data=data,
-            )
+    session = registry.sessions[session_id]
+    if len(session.resource_id_to_node) > STREAM_RESOURCES_THRESHOLD:
+        return StreamingResponse(
+            stream_resources(session), media_type="application/json"
         )
-    return ListResourcesResponse(resources=resources)
+
+    session.refresh_caches()
+    if session.list_resources_cache is None:
+        resources = []
+        for node in session.resource_id_to_node.values():
+            data, result = pack_result(session, [], node.result_obj, recurse=True)
+            resources.append(
+                ResourceResponse(
+                    result=result,
+                    data=data,
+                )
+            )
+        body = ListResourcesResponse(resources=resources).model_dump_json().encode()
+        # Packing can register nested resources, which invalidates older bodies
+        session.refresh_caches()
+        session.list_resources_cache = body
+
+    return json_response(session.list_resources_cache)
 
 
 @router.delete("/sessions/{session_id}", response_model=DeleteSessionResponse)
-async def delete_session(session_id: str):
+async def delete_session(
+    session_id: str, registry: NodeGraphRegistry = Depends(get_registry)
+):
     """
     Delete a session and all its resources.
 
@@ -573,11 +725,11 @@ async def delete_session(session_id: str):
     Raises:
         HTTPException: If the session is not found.
     """
-    if session_id not in _sessions:
+    if session_id not in registry.sessions:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
         )
-    del _sessions[session_id]
+    registry.remove_session(session_id)
     return DeleteSessionResponse(
         message=f"Session {session_id} and all its resources deleted successfully"
     )
@@ -586,7 +738,11 @@ async def delete_session(session_id: str):
 @router.get(
     "/sessions/{session_id}/resources/{resource_id}", response_model=GetResourceResponse
 )
-async def get_resource(session_id: str, resource_id: int):
+async def get_resource(
+    session_id: str,
+    resource_id: int,
+    registry: NodeGraphRegistry = Depends(get_registry),
+):
     """
     Get a specific resource from a session.
 
@@ -600,26 +756,29 @@ async def get_resource(session_id: str, resource_id: int):
     Raises:
         HTTPException: If the session or resource is not found.
     """
-    if session_id not in _sessions:
+    if session_id not in registry.sessions:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
         )
 
-    await keep_alive(session_id)
+    await keep_alive(session_id, registry)
 
-    if resource_id not in _sessions[session_id].resource_id_to_node:
+    session = registry.sessions[session_id]
+    if resource_id not in session.resource_id_to_node:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Resource not found in this session",
         )
 
-    node: Resource = _sessions[session_id].resource_id_to_node[resource_id]
-    data, result = pack_result(session_id, [], node.result_obj, recurse=True)
+    session.refresh_caches()
+    if resource_id not in session.resource_cache:
+        node: Resource = session.resource_id_to_node[resource_id]
+        data, result = pack_result(session, [], node.result_obj, recurse=True)
+        body = GetResourceResponse(result=result, data=data).model_dump_json().encode()
+        session.refresh_caches()
+        session.resource_cache[resource_id] = body
 
-    return GetResourceResponse(
-        result=result,
-        data=data,
-    )
+    return json_response(session.resource_cache[resource_id])
 
 
 class InvalidArgumentException(Exception):
@@ -628,10 +787,18 @@ class InvalidArgumentException(Exception):
 
 
 def unpack_argument(
-    session_id: str, key: list[str], arg: Argument | Any
+    session: Session, key: list[str], arg: Argument | Any
 ) -> dict[str, Any]:
     if arg.type == ArgumentType.NODE:
-        return _sessions[session_id].resource_id_to_node[arg.value].result_obj
+        if arg.value not in session.resource_id_to_node:
+            raise InvalidArgumentException(
+                {
+                    "message": f"Node {arg.value} not found in this session",
+                    "key": ".".join(key),
+                    "value": arg.value,
+                }
+            )
+        return session.resource_id_to_node[arg.value].result_obj
     elif arg.type in (
         ArgumentType.STR,
         ArgumentType.FLOAT,
@@ -641,21 +808,19 @@ def unpack_argument(
         return arg.value
     elif arg.type == ArgumentType.LIST:
         return [
-            unpack_argument(session_id, key + [i], item)
+            unpack_argument(session, key + [i], item)
             for i, item in enumerate(arg.value)
         ]
     elif arg.type == ArgumentType.DICT:
-        return {
-            k: unpack_argument(session_id, key + [k], v) for k, v in arg.value.items()
-        }
+        return {k: unpack_argument(session, key + [k], v) for k, v in arg.value.items()}
     elif arg.type == ArgumentType.TUPLE:
         return tuple(
-            unpack_argument(session_id, key + [i], item)
+            unpack_argument(session, key + [i], item)
             for i, item in enumerate(arg.value)
         )
     elif arg.type == ArgumentType.SET:
         return {
-            unpack_argument(session_id, key + [i], item)
+            unpack_argument(session, key + [i], item)
             for i, item in enumerate(arg.value)
         }
     else:
@@ -669,24 +834,24 @@ def unpack_argument(
         )
 
 
-def create_obj_node(session_id: str, obj: Any) -> Resource:
-    if obj in _sessions[session_id].resource_obj_to_node:
-        return _sessions[session_id].resource_obj_to_node[obj]
+def create_obj_node(session: Session, obj: Any) -> Resource:
+    if obj in session.resource_obj_to_node:
+        return session.resource_obj_to_node[obj]
 
-    node_id = len(_sessions[session_id].resource_id_to_node) + 1
+    node_id = len(session.resource_id_to_node) + 1
     node = Resource(
         id=node_id,
         module_name=obj.__module__,
         class_name=obj.__class__.__name__,
         result_obj=obj,
     )
-    _sessions[session_id].resource_id_to_node[node_id] = node
-    _sessions[session_id].resource_obj_to_node[obj] = node
+    session.resource_id_to_node[node_id] = node
+    session.resource_obj_to_node[obj] = node
     return node
 
 
 def pack_result(
-    session_id: str, key: list[str], obj: Any, recurse=True
+    session: Session, key: list[str], obj: Any, recurse=True
 ) -> tuple[Optional[int], Argument | dict[str, Argument]]:
     if obj is None:
         return None, NoneArgument(type="none", value=None)
@@ -697,7 +862,7 @@ def pack_result(
             return None, ListArgument(
                 type="list",
                 value=[
-                    pack_result(session_id, key + [i], item, recurse=False)[1]
+                    pack_result(session, key + [i], item, recurse=False)[1]
                     for i, item in enumerate(obj)
                 ],
             )
@@ -708,7 +873,7 @@ def pack_result(
             return None, DictArgument(
                 type="dict",
                 value={
-                    k: pack_result(session_id, key + [k], v, recurse=False)[1]
+                    k: pack_result(session, key + [k], v, recurse=False)[1]
                     for k, v in obj.items()
                 },
             )
@@ -719,7 +884,7 @@ def pack_result(
             return None, TupleArgument(
                 type="tuple",
                 value=tuple(
-                    pack_result(session_id, key + [i], item, recurse=False)[1]
+                    pack_result(session, key + [i], item, recurse=False)[1]
                     for i, item in enumerate(obj)
                 ),
             )
@@ -730,7 +895,7 @@ def pack_result(
             return None, SetArgument(
                 type="set",
                 value={
-                    pack_result(session_id, key + [i], item, recurse=False)[1]
+                    pack_result(session, key + [i], item, recurse=False)[1]
                     for i, item in enumerate(obj)
                 },
             )
@@ -738,10 +903,10 @@ def pack_result(
             return None, UnsupportedArgument(type="unsupported", value=None)
     elif isinstance(obj, HorseData):
         if not recurse:
-            node = create_obj_node(session_id, obj)
+            node = create_obj_node(session, obj)
             return None, NodeArgument(type="node", value=node.id)
 
-        result_node = create_obj_node(session_id, obj)
+        result_node = create_obj_node(session, obj)
         result_dict = {}
         for attr_name, attr_value in obj.__dict__.items():
             if isinstance(obj, HorseVariable) and attr_name in (
@@ -753,7 +918,7 @@ def pack_result(
 
             else:
                 result_dict[attr_name] = pack_result(
-                    session_id, key + [attr_name], attr_value, recurse=False
+                    session, key + [attr_name], attr_value, recurse=False
                 )[1]
 
         return result_dict, NodeArgument(type="node", value=result_node.id)
@@ -762,11 +927,122 @@ def pack_result(
         return None, UnsupportedArgument(type="unsupported", value=None)
 
 
+async def create_resource(
+    registry: NodeGraphRegistry,
+    session: Session,
+    module_name: str,
+    function_name: str,
+    body: dict,
+) -> ResourceResponse:
+    global _mutation_counter
+
+    kwargs = {}
+    errors = []
+    for key, arg in body.items():
+        try:
+            kwargs[key] = ARGUMENT_ADAPTER.validate_python(arg)
+        except ValidationError:
+            errors.append({"message": "Invalid argument", "key": key, "value": arg})
+
+    if errors:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=errors)
+
+    if "." in function_name:
+        class_name, function_name = function_name.split(".")
+    else:
+        class_name = None
+
+    processed_kwargs = {}
+    errors = []
+    for key, arg in kwargs.items():
+        try:
+            processed_kwargs[key] = unpack_argument(session, [key], arg)
+        except InvalidArgumentException as e:
+            errors.append(e.message)
+
+    if errors:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=errors)
+
+    try:
+        result = await execute(
+            registry, module_name, class_name, function_name, processed_kwargs
+        )
+    finally:
+        # The call may have changed any object, including ones shared with other
+        # sessions
+        _mutation_counter += 1
+
+    result_data, result_argument = pack_result(session, [], result, recurse=True)
+
+    return ResourceResponse(
+        result=result_argument,
+        data=result_data,
+    )
+
+
+def find_batch_refs(index: int, key: list[str], arg: Any) -> set[int]:
+    if isinstance(arg, str):
+        if not re.fullmatch(r"@\d+", arg) or int(arg[1:]) >= index:
+            raise InvalidArgumentException(
+                {
+                    "message": f"Item {index} has an invalid reference: {arg}",
+                    "key": ".".join(key),
+                    "value": arg,
+                }
+            )
+        return {int(arg[1:])}
+
+    # Malformed arguments have no references and are rejected when validated
+    if not isinstance(arg, dict):
+        return set()
+    value = arg.get("value")
+    if arg.get("type") in BATCH_LIST_TYPES and isinstance(value, list):
+        return set().union(
+            *[
+                find_batch_refs(index, key + [str(i)], item)
+                for i, item in enumerate(value)
+            ]
+        )
+    elif arg.get("type") == ArgumentType.DICT and isinstance(value, dict):
+        return set().union(
+            *[find_batch_refs(index, key + [k], v) for k, v in value.items()]
+        )
+    else:
+        return set()
+
+
+def resolve_batch_refs(arg: Any, results: list[dict]) -> Any:
+    if isinstance(arg, str):
+        return results[int(arg[1:])]
+
+    if not isinstance(arg, dict):
+        return arg
+    value = arg.get("value")
+    if arg.get("type") in BATCH_LIST_TYPES and isinstance(value, list):
+        return {
+            "type": arg["type"],
+            "value": [resolve_batch_refs(item, results) for item in value],
+        }
+    elif arg.get("type") == ArgumentType.DICT and isinstance(value, dict):
+        return {
+            "type": arg["type"],
+            "value": {k: resolve_batch_refs(v, results) for k, v in value.items()},
+        }
+    else:
+        return arg
+
+
 @router.post(
     "/sessions/{session_id}/resources/{module_name}/{function_name}",
     response_model=ResourceResponse,
 )
-async def post_resource(session_id, module_name, function_name, body: dict = Body(...)):
+async def post_resource(
+    session_id,
+    module_name,
+    function_name,
+    body: dict = Body(...),
+    registry: NodeGraphRegistry = Depends(get_registry),
+):
     """
     Create a new resource in a session.
 
@@ -781,39 +1057,149 @@ async def post_resource(session_id, module_name, function_name, body: dict = Bod
         HTTPException: If the session is not found, the module is not allowed,
                        or there are errors in processing the arguments.
     """
-    if session_id not in _sessions:
+    if session_id not in registry.sessions:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
         )
+    session = registry.sessions[session_id]
 
-    kwargs = {
-        key: create_argument(type=arg["type"], value=arg["value"])
-        for key, arg in body.items()
-    }
+    await keep_alive(session_id, registry)
 
-    await keep_alive(session_id)
+    return json_response(
+        await create_resource(registry, session, module_name, function_name, body)
+    )
 
-    if "." in function_name:
-        class_name, function_name = function_name.split(".")
-    else:
-        class_name = None
 
-    processed_kwargs = {}
+@router.post(
+    "/sessions/{session_id}/resources:batch",
+    response_model=BatchPostResourceResponse,
+)
+async def post_resource_batch(
+    session_id: str,
+    request: BatchPostResourceRequest,
+    registry: NodeGraphRegistry = Depends(get_registry),
+):
+    """
+    Create several resources in a session with one request.
+
+    An argument can be given as "@<index>" to refer to the result of an earlier
+    item in the batch. Every item's arguments are validated before any item runs.
+
+    Items run one at a time in request order. If `concurrent` is set, items whose
+    references are all available run concurrently in waves instead, and resources
+    are numbered in completion order.
+
+    Args:
+        session_id (str): The ID of the session to create the resources in.
+        request (BatchPostResourceRequest): The resources to create, in order.
+
+    Returns:
+        BatchPostResourceResponse: The details of each created resource, in request order.
+
+    Raises:
+        HTTPException: If the session is not found or an argument or reference is
+                       invalid (400, before anything runs). If an item fails, no
+                       further items are started and the error has the failing
+                       item's status code (500 for unexpected errors). Its
+                       detail holds the failing item's "index", its error
+                       "detail", and the "results" of the items that were
+                       created (null for the rest).
+    """
+    if session_id not in registry.sessions:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Session not found"
+        )
+    session = registry.sessions[session_id]
+
+    await keep_alive(session_id, registry)
+
+    # Check references and validate arguments with a placeholder for each result
+    placeholders = [NodeArgument(value=0).model_dump()] * len(request.items)
+    dependencies: dict[int, set[int]] = {}
     errors = []
-    for key, arg in kwargs.items():
-        try:
-            processed_kwargs[key] = unpack_argument(session_id, [key], arg)
-        except InvalidArgumentException as e:
-            errors.append(e.message)
+    for index, item in enumerate(request.items):
+        dependencies[index] = set()
+        for key, arg in item.kwargs.items():
+            try:
+                dependencies[index] |= find_batch_refs(index, [key], arg)
+                ARGUMENT_ADAPTER.validate_python(resolve_batch_refs(arg, placeholders))
+            except InvalidArgumentException as e:
+                errors.append(e.message)
+            except ValidationError:
+                errors.append(
+                    {
+                        "message": f"Item {index} has an invalid argument",
+                        "key": key,
+                        "value": arg,
+                    }
+                )
 
     if errors:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=errors)
 
-    result = await execute(module_name, class_name, function_name, processed_kwargs)
+    results: list[Optional[ResourceResponse]] = [None] * len(request.items)
 
-    result_data, result_argument = pack_result(session_id, [], result, recurse=True)
+    async def create_item(index: int) -> ResourceResponse:
+        item = request.items[index]
+        resolved = [None if r is None else r.result.model_dump() for r in results]
+        return await create_resource(
+            registry,
+            session,
+            item.module_name,
+            item.function_name,
+            {
+                key: resolve_batch_refs(arg, resolved)
+                for key, arg in item.kwargs.items()
+            },
+        )
 
-    return ResourceResponse(
-        result=result_argument,
-        data=result_data,
-    )
+    def batch_failure(index: int, e: Exception) -> HTTPException:
+        if isinstance(e, HTTPException):
+            status_code, detail = e.status_code, e.detail
+        else:
+            status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+            detail = {"error": "Failed to create resource", "message": str(e)}
+        return HTTPException(
+            status_code=status_code,
+            detail={
+                "index": index,
+                "detail": detail,
+                "results": [
+                    None if r is None else r.model_dump(mode="json") for r in results
+                ],
+            },
+        )
+
+    if not request.concurrent:
+        for index in range(len(request.items)):
+            try:
+                results[index] = await create_item(index)
+            except Exception as e:
+                raise batch_failure(index, e)
+
+        return json_response(BatchPostResourceResponse(results=results))
+
+    # References only point backwards, so each wave contains at least one item.
+    # A failed wave still records the items that succeeded before reporting.
+    while dependencies:
+        ready = [
+            index
+            for index, refs in dependencies.items()
+            if all(results[ref] is not None for ref in refs)
+        ]
+        responses = await asyncio.gather(
+            *[create_item(index) for index in ready], return_exceptions=True
+        )
+        failures = []
+        for index, response in zip(ready, responses):
+            if isinstance(response, Exception):
+                failures.append((index, response))
+            elif isinstance(response, BaseException):
+                raise response
+            else:
+                results[index] = response
+                del dependencies[index]
+        if failures:
+            raise batch_failure(*failures[0])
+
+    return json_response(BatchPostResourceResponse(results=results))
@@ -1,7 +1,7 @@
 from enum import StrEnum, auto
-from typing import Any, Generic, Literal, Optional, Self, Union
+from typing import Annotated, Any, Generic, Literal, Optional, Self, Union
 
-from pydantic import BaseModel, field_validator, model_validator
+from pydantic import BaseModel, Field, TypeAdapter, field_validator, model_validator
 
 
 class ArgumentType(StrEnum):
@@ -54,7 +54,7 @@ class ListArgument(BaseModel):
 
     @model_validator(mode="after")
     def validate_list(self) -> Self:
-        self.value = [create_argument(**x) for x in self.value]
+        self.value = [ARGUMENT_ADAPTER.validate_python(x) for x in self.value]
         return self
 
 
@@ -64,7 +64,9 @@ class DictArgument(BaseModel):
 
     @model_validator(mode="after")
     def validate_dict(self) -> Self:
-        self.value = {k: create_argument(**v) for k, v in self.value.items()}
+        self.value = {
+            k: ARGUMENT_ADAPTER.validate_python(v) for k, v in self.value.items()
+        }
         return self
 
 
@@ -74,7 +76,7 @@ class TupleArgument(BaseModel):
 
     @model_validator(mode="after")
     def validate_tuple(self) -> Self:
-        self.value = tuple([create_argument(**x) for x in self.value])
+        self.value = tuple([ARGUMENT_ADAPTER.validate_python(x) for x in self.value])
         return self
 
 
@@ -84,7 +86,7 @@ class SetArgument(BaseModel):
 
     @model_validator(mode="after")
     def validate_set(self) -> Self:
-        self.value = set([create_argument(**x) for x in self.value])
+        self.value = set([ARGUMENT_ADAPTER.validate_python(x) for x in self.value])
         return self
 
 
@@ -107,6 +109,10 @@ Argument = Union[
     NodeArgument,
 ]
 
+# Validates any argument by dispatching on its type field
+DiscriminatedArgument = Annotated[Argument, Field(discriminator="type")]
+ARGUMENT_ADAPTER = TypeAdapter(DiscriminatedArgument)
+
 
 def create_argument(type: ArgumentType, value: Any) -> Argument:
     if type == ArgumentType.NONE:
@@ -155,8 +161,8 @@ class KeepAliveResponse(BaseModel):
 
 
 class ResourceResponse(BaseModel):
-    result: Argument
-    data: Optional[dict[str, Argument]] = None
+    result: DiscriminatedArgument
+    data: Optional[dict[str, DiscriminatedArgument]] = None
 
 
 class ListResourcesResponse(BaseModel):
@@ -169,3 +175,21 @@ class DeleteSessionResponse(BaseModel):
 
 class GetResourceResponse(ResourceResponse):
     pass
+
+
+class BatchResourceItem(BaseModel):
+    module_name: str
+    function_name: str
+    # Arguments may contain "@<index>" references at any depth, so they are
+    # validated by the endpoint once references are resolved
+    kwargs: dict[str, Any] = {}
+
+
+class BatchPostResourceRequest(BaseModel):
+    items: list[BatchResourceItem]
+    # Run items whose references are available concurrently instead of in order
+    concurrent: bool = False
+
+
+class BatchPostResourceResponse(BaseModel):
+    results: list[ResourceResponse]
@@ -56,6 +56,22 @@ class RateLimits(HorseData):
             *[limit.wait_for(expected_tokens) for limit in self.token_limits],
         )
 
+    async def acquire(self, tokens: int) -> None:
+        """Wait until every limit allows the tokens, then record their consumption."""
+        # Sleep until the latest limit allows the tokens. If a concurrent caller
+        # consumed from any limit in the meantime, the wait is recomputed.
+        # Nothing is awaited between the final check and the report.
+        limits = [*self.call_limits, *self.token_limits]
+        while True:
+            last_blocked = [limit.last_blocked for limit in limits]
+            next_allowed = self.next_allowed(tokens)
+            now = time.time()
+            if next_allowed > now:
+                await asyncio.sleep(next_allowed - now)
+            if last_blocked == [limit.last_blocked for limit in limits]:
+                break
+        self.report_tokens_consumed(tokens)
+
     def next_allowed(self, expected_tokens: Optional[int] = None) -> float:
         """Return timestamp when both call and token consumption will be allowed."""
         if self.call_limits:
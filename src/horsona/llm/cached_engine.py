@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+from typing import Any, Optional, Type, TypeVar
+
+from pydantic import BaseModel, TypeAdapter
+
+from horsona.llm.base_engine import AsyncLLMEngine, LLMMetrics
+from horsona.llm.engine_utils import compile_user_prompt
+from horsona.llm.wrapper_llm import WrapperLLMEngine
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class CachedLLMEngine(WrapperLLMEngine):
+    """
+    Wraps an engine and stores its responses on disk so repeated queries are
+    answered without calling the underlying LLM.
+
+    Responses are keyed by the underlying engine, the query type, the compiled
+    prompt, and the API arguments. Streaming queries are passed through uncached.
+    Cache hits consume no tokens, so they are not added to any metrics.
+    """
+
+    def __init__(
+        self,
+        underlying_llm: AsyncLLMEngine,
+        cache_dir: str = ".llmcache",
+        *args,
+        **kwargs,
+    ):
+        super().__init__(underlying_llm, *args, **kwargs)
+        # Cache misses are limited by the underlying engine, and MultiEngine
+        # picks engines by their rate limits
+        self.rate_limit = underlying_llm.rate_limit
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    async def query_response(self, metrics: LLMMetrics = None, **kwargs) -> str:
+        key = await self._cache_key("response", None, kwargs)
+        cached = self._load(key)
+        if cached is not None:
+            return json.loads(cached)
+
+        result = await super().query_response(metrics=metrics, **kwargs)
+        self._store(key, json.dumps(result))
+        return result
+
+    async def query_object(self, response_model: Type[T], **kwargs) -> T:
+        adapter = TypeAdapter(response_model)
+        key = await self._cache_key("object", adapter.json_schema(), kwargs)
+        cached = self._load(key)
+        if cached is not None:
+            return adapter.validate_json(cached)
+
+        result = await super().query_object(response_model, **kwargs)
+        self._store(key, adapter.dump_json(result).decode())
+        return result
+
+    async def query_block(self, block_type: str, **kwargs) -> str:
+        key = await self._cache_key("block", block_type, kwargs)
+        cached = self._load(key)
+        if cached is not None:
+            return json.loads(cached)
+
+        result = await super().query_block(block_type, **kwargs)
+        self._store(key, json.dumps(result))
+        return result
+
+    async def query_continuation(self, prompt: str, **kwargs) -> str:
+        key = await self._cache_key("continuation", prompt, kwargs)
+        cached = self._load(key)
+        if cached is not None:
+            return json.loads(cached)
+
+        result = await super().query_continuation(prompt, **kwargs)
+        self._store(key, json.dumps(result))
+        return result
+
+    async def _cache_key(self, query_type: str, query_arg: Any, kwargs: dict) -> str:
+        prompt_args = {k: v for k, v in kwargs.items() if k == k.upper()}
+        # Metrics objects only collect usage and don't affect the response
+        api_args = {
+            k: v for k, v in kwargs.items() if k != k.upper() and k != "metrics"
+        }
+
+        key_data = [
+            type(self.underlying_llm).__name__,
+            getattr(self.underlying_llm, "model", self.underlying_llm.name),
+            query_type,
+            query_arg,
+            await compile_user_prompt(**prompt_args),
+            api_args,
+        ]
+        serialized = json.dumps(key_data, sort_keys=True, default=str)
+        return hashlib.sha256(serialized.encode()).hexdigest()
+
+    def _load(self, key: str) -> Optional[str]:
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as f:
+            return f.read()
+
+    def _store(self, key: str, value: str) -> None:
+        # Write to a temporary file first so concurrent readers never see a
+        # partial entry
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
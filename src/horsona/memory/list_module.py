@@ -76,12 +76,16 @@ class ListModule(HorseModule, Generic[T]):
             self.pending_items = []
             result = new_item
 
-        # Remove oldest items until under max length
-        while self.items and (
-            sum(self.item_lengths) + pending_length > self.max_length
-        ):
-            self.items.pop(0)
-            self.item_lengths.pop(0)
+        # Remove oldest items until under max length. The total is summed once and
+        # the evicted items are removed in a single slice.
+        total_length = sum(self.item_lengths) + pending_length
+        evicted = 0
+        while evicted < len(self.items) and total_length > self.max_length:
+            total_length -= self.item_lengths[evicted]
+            evicted += 1
+        if evicted:
+            del self.items[:evicted]
+            del self.item_lengths[:evicted]
 
         return result
 
@@ -3,12 +3,22 @@ import warnings
 
 import pytest
 from dotenv import load_dotenv
+from pytest_asyncio import is_async_test
 
 from horsona.config import load_indices, load_llms
 
 load_dotenv()
 
 
+def pytest_collection_modifyitems(items):
+    # Run every async test on the same session-scoped event loop as the
+    # session-scoped async fixtures
+    session_scope_marker = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if is_async_test(item):
+            item.add_marker(session_scope_marker, append=False)
+
+
 class FixtureFunctionWrapper:
     def __init__(self, name, obj):
         self.__name__ = name
@@ -1,421 +1,684 @@
-import asyncio
-
 import pytest
-from fastapi import FastAPI, Response, status
-from fastapi.testclient import TestClient
+from fastapi import FastAPI
+from httpx import ASGITransport, AsyncClient
+from pydantic import BaseModel
 
+from horsona.autodiff.basic import HorseVariable
+from horsona.autodiff.functions import extract_object
+from horsona.autodiff.losses import apply_loss
 from horsona.autodiff.variables import Value
+from horsona.config import get_llm, llms
 from horsona.interface import node_graph
-from horsona.interface.node_graph.node_graph_api import Argument, ArgumentType
-from horsona.interface.node_graph.node_graph_models import (
-    Argument,
-    CreateSessionResponse,
-    FloatArgument,
-    IntArgument,
-    ListArgument,
-    ListResourcesResponse,
-    NodeArgument,
-    ResourceResponse,
-    StrArgument,
-    create_argument,
-)
+from horsona.interface.node_graph import node_graph_api
+from horsona.interface.node_graph.node_graph_models import ArgumentType
 from horsona.llm.base_engine import AsyncLLMEngine
 
+VALUE_INIT = f"{Value.__module__}/{Value.__name__}.__init__"
+GET_LLM = f"{get_llm.__module__}/{get_llm.__name__}"
 
-@pytest.fixture
-async def client():
+
+def _arg(type: ArgumentType, value):
+    # Request payloads are built as plain dicts to skip pydantic validation
+    return {"type": type, "value": value}
+
+
+# Argument payloads shared by several requests
+SOME_NUMBER_ARG = _arg(ArgumentType.STR, "Some number")
+TEST_ARG = _arg(ArgumentType.STR, "test")
+FLOAT_ONE_ARG = _arg(ArgumentType.FLOAT, 1.0)
+REASONING_LLM_ARG = _arg(ArgumentType.STR, "reasoning_llm")
+
+# Request bodies shared by several requests
+SOME_NUMBER_VALUE_BODY = {"datatype": SOME_NUMBER_ARG, "value": FLOAT_ONE_ARG}
+TEST_VALUE_BODY = {"datatype": TEST_ARG, "value": FLOAT_ONE_ARG}
+REASONING_LLM_BODY = {"name": REASONING_LLM_ARG}
+
+# configure() arguments for the registry shared by most tests
+SHARED_CONFIG = {"extra_modules": ["json", "random", __name__]}
+
+
+@pytest.fixture(scope="session")
+def app():
     app = FastAPI()
     app.include_router(node_graph.api_router)
+    return app
 
-    with TestClient(app) as client:
+
+@pytest.fixture(scope="session")
+async def client(app):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://test") as client:
         yield client
 
 
-@pytest.mark.asyncio
-@pytest.mark.xdist_group(name="node_graph_sequential")
-async def test_post_resource(client):
-    from horsona.config import get_llm
+@pytest.fixture(scope="session")
+def shared_registry():
+    registry = node_graph.NodeGraphRegistry()
+    registry.configure(**SHARED_CONFIG)
+    return registry
 
-    node_graph.configure()
 
-    # Create a session
-    create_session_response: Response = client.post("/api/sessions")
-    assert create_session_response.status_code == status.HTTP_200_OK
-    create_session_obj = CreateSessionResponse(**create_session_response.json())
-    session_id = create_session_obj.session_id
+@pytest.fixture(autouse=True)
+async def registry(request, app, shared_registry):
+    # Tests share one registry that allows every module they call into. Tests
+    # that need a different configuration pass configure() arguments through
+    # indirect parametrization and get an isolated registry.
+    if hasattr(request, "param"):
+        registry = node_graph.NodeGraphRegistry()
+        registry.configure(**request.param)
+    else:
+        # Reconfiguring with the same arguments only clears the sessions
+        registry = shared_registry
+        registry.configure(**SHARED_CONFIG)
+    app.state.node_graph = registry
 
+    # ASGITransport doesn't run the app lifespan, so the cleanup task is
+    # managed here
+    await registry.start_session_cleanup_task()
+    yield registry
+    await registry.stop_session_cleanup_task()
+
+
+@pytest.fixture
+async def session_id(client, registry):
+    # Depends on registry so the session is created on the registry the test runs
+    # against
+    create_session_response = await client.post("/api/sessions")
+    assert create_session_response.status_code == 200
+    return create_session_response.json()["session_id"]
+
+
+@pytest.mark.asyncio
+async def test_post_resource(client, session_id, fake_llm):
     # Create a Value that wraps a float
-    create_float_value_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{Value.__module__}/{Value.__name__}.__init__",
-        json={
-            "datatype": StrArgument(value="Some number").model_dump(),
-            "value": FloatArgument(value=1.0).model_dump(),
-        },
+    create_float_value_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{VALUE_INIT}",
+        json=SOME_NUMBER_VALUE_BODY,
     )
-    print(create_float_value_response.json())
-    assert create_float_value_response.status_code == status.HTTP_200_OK
-    create_float_value_obj = ResourceResponse(**create_float_value_response.json())
+    assert create_float_value_response.status_code == 200
+    create_float_value_data = create_float_value_response.json()
 
-    assert create_float_value_obj.data["datatype"] == StrArgument(value="Some number")
-    assert create_float_value_obj.data["value"] == FloatArgument(value=1.0)
+    assert create_float_value_data["data"]["datatype"]["value"] == "Some number"
+    assert create_float_value_data["data"]["value"]["type"] == ArgumentType.FLOAT
+    assert create_float_value_data["data"]["value"]["value"] == 1.0
 
     # Create a Value that wraps another Value
-    create_value_value_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{Value.__module__}/{Value.__name__}.__init__",
+    create_value_value_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{VALUE_INIT}",
         json={
-            "datatype": StrArgument(value="Some number").model_dump(),
-            "value": create_float_value_obj.result.model_dump(),
+            "datatype": SOME_NUMBER_ARG,
+            "value": create_float_value_data["result"],
         },
     )
-    assert create_value_value_response.status_code == status.HTTP_200_OK
-    create_value_value_obj = ResourceResponse(**create_value_value_response.json())
+    assert create_value_value_response.status_code == 200
+    create_value_value_data = create_value_value_response.json()
 
-    assert create_value_value_obj.data["datatype"] == StrArgument(value="Some number")
-    assert create_value_value_obj.data["value"] == create_float_value_obj.result
+    assert create_value_value_data["data"]["datatype"]["value"] == "Some number"
+    assert create_value_value_data["data"]["value"] == create_float_value_data["result"]
 
     # Create an LLM engine
-    create_llm_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{get_llm.__module__}/{get_llm.__name__}",
-        json={"name": StrArgument(value="reasoning_llm").model_dump()},
+    create_llm_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{GET_LLM}",
+        json=REASONING_LLM_BODY,
+    )
+    assert create_llm_response.status_code == 200
+    create_llm_data = create_llm_response.json()
+    assert create_llm_data["result"]["type"] == ArgumentType.NODE
+
+    # List resources
+    list_resources_response = await client.get(f"/api/sessions/{session_id}/resources")
+    assert list_resources_response.status_code == 200
+    resources = list_resources_response.json()["resources"]
+
+    # Verify that the created resources are in the list of resources. The LLM
+    # engine registers its nested resources too.
+    assert len(resources) == 4
+    assert create_float_value_data in resources
+    assert create_value_value_data in resources
+    assert create_llm_data in resources
+
+    # Creating another resource invalidates the cached list
+    create_value_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{VALUE_INIT}",
+        json=TEST_VALUE_BODY,
     )
-    assert create_llm_response.status_code == status.HTTP_200_OK
-    create_llm_obj = ResourceResponse(**create_llm_response.json())
-    assert isinstance(create_llm_obj.result, NodeArgument)
+    assert create_value_response.status_code == 200
+    list_resources_response = await client.get(f"/api/sessions/{session_id}/resources")
+    assert create_value_response.json() in list_resources_response.json()["resources"]
+
+
+def rename_llm(llm: AsyncLLMEngine, name: str) -> None:
+    # Changes an existing object without returning a new resource
+    llm.name = name
 
 
 @pytest.mark.asyncio
-@pytest.mark.xdist_group(name="node_graph_sequential")
-async def test_invalid_module(client):
-    node_graph.configure()
-    # Create a session
-    create_session_response = client.post("/api/sessions")
-    assert create_session_response.status_code == status.HTTP_200_OK
-    session_id = CreateSessionResponse(**create_session_response.json()).session_id
-
-    # Test invalid module
-    create_invalid_module_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/invalid_module/invalid_function",
-        json={},
-    )
+async def test_cached_resources_see_changes(client, session_id, registry, fake_llm):
+    # get_llm returns the same engine to every session
+    other_session_response = await client.post("/api/sessions")
+    assert other_session_response.status_code == 200
+    other_session_id = other_session_response.json()["session_id"]
+
+    llm_ids = {}
+    for sid in (session_id, other_session_id):
+        create_llm_response = await client.post(
+            f"/api/sessions/{sid}/resources/{GET_LLM}",
+            json=REASONING_LLM_BODY,
+        )
+        assert create_llm_response.status_code == 200
+        llm_ids[sid] = create_llm_response.json()["result"]["value"]
 
-    assert create_invalid_module_response.status_code == status.HTTP_404_NOT_FOUND
-    assert "Module not found" in create_invalid_module_response.json()["detail"]
+    async def get_llm_name():
+        get_response = await client.get(
+            f"/api/sessions/{session_id}/resources/{llm_ids[session_id]}"
+        )
+        assert get_response.status_code == 200
+        return get_response.json()["data"]["name"]["value"]
+
+    async def list_llm_names():
+        list_response = await client.get(f"/api/sessions/{session_id}/resources")
+        assert list_response.status_code == 200
+        return [
+            resource["data"]["name"]["value"]
+            for resource in list_response.json()["resources"]
+            if resource["result"]["value"] == llm_ids[session_id]
+        ]
+
+    async def rename(sid, name):
+        rename_response = await client.post(
+            f"/api/sessions/{sid}/resources/{__name__}/rename_llm",
+            json={
+                "llm": _arg(ArgumentType.NODE, llm_ids[sid]),
+                "name": _arg(ArgumentType.STR, name),
+            },
+        )
+        assert rename_response.status_code == 200
+        assert rename_response.json()["result"]["type"] == ArgumentType.NONE
+
+    # Cache the responses, then change the engine in place from the same session
+    await get_llm_name()
+    await list_llm_names()
+    session = registry.sessions[session_id]
+    resource_count = len(session.resource_id_to_node)
+    await rename(session_id, "renamed")
+    assert len(session.resource_id_to_node) == resource_count
+    assert await get_llm_name() == "renamed"
+    assert await list_llm_names() == ["renamed"]
+
+    # Changes made through another session are visible too
+    await rename(other_session_id, "renamed again")
+    assert await get_llm_name() == "renamed again"
+    assert await list_llm_names() == ["renamed again"]
+
+    # Bodies cached before a change are dropped instead of accumulating
+    for resource_id in session.resource_id_to_node:
+        get_response = await client.get(
+            f"/api/sessions/{session_id}/resources/{resource_id}"
+        )
+        assert get_response.status_code == 200
+    await rename(session_id, "renamed once more")
+    assert await get_llm_name() == "renamed once more"
+    assert list(session.resource_cache) == [llm_ids[session_id]]
 
 
 @pytest.mark.asyncio
-@pytest.mark.xdist_group(name="node_graph_sequential")
-async def test_allowed_modules(client):
-    from horsona.config import get_llm
+async def test_list_resources_streamed(client, session_id, monkeypatch):
+    # Create a resource
+    create_value_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{VALUE_INIT}",
+        json=TEST_VALUE_BODY,
+    )
+    assert create_value_response.status_code == 200
+    list_resources_response = await client.get(f"/api/sessions/{session_id}/resources")
 
-    node_graph.configure()
+    # Large sessions are streamed with the same content
+    monkeypatch.setattr(node_graph_api, "STREAM_RESOURCES_THRESHOLD", 0)
+    stream_resources_response = await client.get(
+        f"/api/sessions/{session_id}/resources"
+    )
+    assert stream_resources_response.status_code == 200
+    assert stream_resources_response.json() == list_resources_response.json()
 
-    # Create a session
-    create_session_response: Response = client.post("/api/sessions")
-    assert create_session_response.status_code == status.HTTP_200_OK
-    create_session_obj = CreateSessionResponse(**create_session_response.json())
-    session_id = create_session_obj.session_id
 
-    # Test that horsona module is allowed by default
-    create_value_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{Value.__module__}/{Value.__name__}.__init__",
+@pytest.mark.asyncio
+async def test_post_resource_batch(client, session_id, monkeypatch):
+    # Create a Value that wraps a float and a Value that wraps it in one batch
+    value_item = {
+        "module_name": Value.__module__,
+        "function_name": f"{Value.__name__}.__init__",
+    }
+    batch_response = await client.post(
+        f"/api/sessions/{session_id}/resources:batch",
         json={
-            "datatype": StrArgument(value="Test").model_dump(),
-            "value": FloatArgument(value=1.0).model_dump(),
+            "items": [
+                {
+                    **value_item,
+                    "kwargs": SOME_NUMBER_VALUE_BODY,
+                },
+                {**value_item, "kwargs": {"datatype": SOME_NUMBER_ARG, "value": "@0"}},
+            ]
         },
     )
-    assert create_value_response.status_code == status.HTTP_200_OK
-    create_value_obj = ResourceResponse(**create_value_response.json())
-    assert "error" not in create_value_obj.model_dump()
+    assert batch_response.status_code == 200
+    results = batch_response.json()["results"]
 
-    # Test that other modules are disallowed by default
-    create_json_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/json/dumps",
+    assert len(results) == 2
+    assert results[0]["data"]["value"]["value"] == 1.0
+    assert results[1]["data"]["value"] == results[0]["result"]
+
+    # References can only point to earlier items
+    invalid_batch_response = await client.post(
+        f"/api/sessions/{session_id}/resources:batch",
+        json={
+            "items": [
+                {**value_item, "kwargs": {"datatype": SOME_NUMBER_ARG, "value": "@0"}}
+            ]
+        },
+    )
+    assert invalid_batch_response.status_code == 400
+
+    # Malformed arguments are rejected before any item runs
+    list_resources_response = await client.get(f"/api/sessions/{session_id}/resources")
+    resource_count = len(list_resources_response.json()["resources"])
+    for malformed_arg in [5, {"value": 1.0}, {"type": "bogus", "value": 1.0}]:
+        malformed_batch_response = await client.post(
+            f"/api/sessions/{session_id}/resources:batch",
+            json={
+                "items": [
+                    {**value_item, "kwargs": TEST_VALUE_BODY},
+                    {
+                        **value_item,
+                        "kwargs": {"datatype": TEST_ARG, "value": malformed_arg},
+                    },
+                ]
+            },
+        )
+        assert malformed_batch_response.status_code == 400
+    list_resources_response = await client.get(f"/api/sessions/{session_id}/resources")
+    assert len(list_resources_response.json()["resources"]) == resource_count
+
+    # Items run in request order, so resources are numbered in request order
+    ordered_batch_response = await client.post(
+        f"/api/sessions/{session_id}/resources:batch",
+        json={"items": [{**value_item, "kwargs": TEST_VALUE_BODY}] * 3},
+    )
+    assert ordered_batch_response.status_code == 200
+    ordered_ids = [
+        r["result"]["value"] for r in ordered_batch_response.json()["results"]
+    ]
+    assert ordered_ids == sorted(ordered_ids)
+
+    # A failing item stops the batch and reports the items created before it
+    failed_batch_response = await client.post(
+        f"/api/sessions/{session_id}/resources:batch",
+        json={
+            "items": [
+                {**value_item, "kwargs": TEST_VALUE_BODY},
+                {"module_name": Value.__module__, "function_name": "missing"},
+                {**value_item, "kwargs": TEST_VALUE_BODY},
+            ]
+        },
+    )
+    assert failed_batch_response.status_code == 404
+    failure = failed_batch_response.json()["detail"]
+    assert failure["index"] == 1
+    assert failure["detail"] == "Function not found"
+    assert failure["results"][0]["data"]["datatype"]["value"] == "test"
+    assert failure["results"][1:] == [None, None]
+
+    # Unknown nodes are reported the same way
+    unknown_node_batch_response = await client.post(
+        f"/api/sessions/{session_id}/resources:batch",
+        json={
+            "items": [
+                {**value_item, "kwargs": TEST_VALUE_BODY},
+                {
+                    **value_item,
+                    "kwargs": {
+                        "datatype": TEST_ARG,
+                        "value": _arg(ArgumentType.NODE, 10**6),
+                    },
+                },
+            ]
+        },
+    )
+    assert unknown_node_batch_response.status_code == 400
+    failure = unknown_node_batch_response.json()["detail"]
+    assert failure["index"] == 1
+    assert failure["results"][0]["data"]["datatype"]["value"] == "test"
+    assert failure["results"][1] is None
+
+    # So are unexpected errors, whether or not items run concurrently
+    def fail_pack_result(*args, **kwargs):
+        raise RuntimeError("pack failed")
+
+    monkeypatch.setattr(node_graph_api, "pack_result", fail_pack_result)
+    for concurrent in [False, True]:
+        error_batch_response = await client.post(
+            f"/api/sessions/{session_id}/resources:batch",
+            json={
+                "items": [{**value_item, "kwargs": TEST_VALUE_BODY}],
+                "concurrent": concurrent,
+            },
+        )
+        assert error_batch_response.status_code == 500
+        failure = error_batch_response.json()["detail"]
+        assert failure["index"] == 0
+        assert failure["detail"]["message"] == "pack failed"
+        assert failure["results"] == [None]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "module_name, function_name",
+    [
+        ("invalid_module", "invalid_function"),
+        ("os", "getcwd"),
+        ("sys", "exit"),
+    ],
+)
+async def test_module_not_found(client, session_id, module_name, function_name):
+    # Test that the module is rejected
+    create_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{module_name}/{function_name}",
+        json={},
+    )
+
+    assert create_response.status_code == 404
+    assert "Module not found" in create_response.json()["detail"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("registry", [{}], indirect=True)
+async def test_default_allowed_modules(client, session_id):
+    # Test that horsona module is allowed by default
+    create_value_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{VALUE_INIT}",
         json={
-            "obj": create_argument(
-                type=ArgumentType.DICT,
-                value={"key": StrArgument(value="value").model_dump()},
-            ).model_dump(),
-            "indent": IntArgument(value=2).model_dump(),
+            "datatype": _arg(ArgumentType.STR, "Test"),
+            "value": FLOAT_ONE_ARG,
         },
     )
+    assert create_value_response.status_code == 200
+    assert "error" not in create_value_response.json()
 
-    assert create_json_response.status_code == status.HTTP_404_NOT_FOUND
+    # Test that other modules are rejected by default
+    create_json_response = await client.post(
+        f"/api/sessions/{session_id}/resources/json/dumps",
+        json={},
+    )
+    assert create_json_response.status_code == 404
     assert "Module not found" in create_json_response.json()["detail"]
 
-    # Test with custom allowed modules
-    node_graph.configure(extra_modules=["json", "random"])
-    custom_session_response = client.post("/api/sessions")
-    assert custom_session_response.status_code == status.HTTP_200_OK
-    custom_session_obj = CreateSessionResponse(**custom_session_response.json())
-    custom_session_id = custom_session_obj.session_id
 
+@pytest.mark.asyncio
+async def test_extra_allowed_modules(client, session_id, fake_llm):
     # Test that horsona module is still allowed
-    create_llm_response = client.post(
-        f"/api/sessions/{custom_session_id}/resources/{get_llm.__module__}/{get_llm.__name__}",
-        json={"name": StrArgument(value="reasoning_llm").model_dump()},
+    create_llm_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{GET_LLM}",
+        json=REASONING_LLM_BODY,
     )
-    assert create_llm_response.status_code == status.HTTP_200_OK
+    assert create_llm_response.status_code == 200
 
     # Test that custom modules are now allowed
-    create_json_response = client.post(
-        f"/api/sessions/{custom_session_id}/resources/json/dumps",
+    create_json_response = await client.post(
+        f"/api/sessions/{session_id}/resources/json/dumps",
         json={
-            "obj": create_argument(
-                type=ArgumentType.DICT,
-                value={"key": StrArgument(value="value").model_dump()},
-            ).model_dump(),
-            "indent": IntArgument(value=2).model_dump(),
+            "obj": _arg(ArgumentType.DICT, {"key": _arg(ArgumentType.STR, "value")}),
+            "indent": _arg(ArgumentType.INT, 2),
         },
     )
-    assert create_json_response.status_code == status.HTTP_200_OK
+    assert create_json_response.status_code == 200
 
-    create_random_response = client.post(
-        f"/api/sessions/{custom_session_id}/resources/random/randint",
+    create_random_response = await client.post(
+        f"/api/sessions/{session_id}/resources/random/randint",
         json={
-            "a": IntArgument(value=1).model_dump(),
-            "b": IntArgument(value=10).model_dump(),
+            "a": _arg(ArgumentType.INT, 1),
+            "b": _arg(ArgumentType.INT, 10),
         },
     )
-    assert create_random_response.status_code == status.HTTP_200_OK
+    assert create_random_response.status_code == 200
 
-    # Test that non-specified modules are still disallowed
-    create_os_response: Response = client.post(
-        f"/api/sessions/{custom_session_id}/resources/os/getcwd",
-        json={},
-    )
-    assert create_os_response.status_code == status.HTTP_404_NOT_FOUND
-    assert "Module not found" in create_os_response.json()["detail"]
 
+def test_configure_retry_after_failed_scan():
+    registry = node_graph.NodeGraphRegistry()
+    config = {"extra_modules": ["json", "missing_module"]}
 
-# Test session timeout and keep_alive
-@pytest.mark.asyncio
-@pytest.mark.xdist_group(name="node_graph_sequential")
-async def test_session_timeout(client):
-    # Configure node_graph with a short timeout
-    node_graph.configure(session_timeout=0.5, session_cleanup_interval=0.25)
+    # A failed scan isn't recorded, so retrying with the same arguments fails
+    # again instead of keeping a partial scan
+    for _ in range(2):
+        with pytest.raises(ModuleNotFoundError):
+            registry.configure(**config)
+    assert registry.current_config is None
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
 
-    # Create a session
-    create_session_response: Response = client.post("/api/sessions")
-    assert create_session_response.status_code == status.HTTP_200_OK
-    create_session_obj = CreateSessionResponse(**create_session_response.json())
-    session_id = create_session_obj.session_id
+    def tick(self, seconds: float):
+        self.now += seconds
 
+
+# Test session timeout and keep_alive
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "registry", [{"session_timeout": 10, "clock": FakeClock()}], indirect=True
+)
+async def test_session_timeout(client, session_id, registry):
     # Verify the session is active by posting a resource
-    create_value_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/horsona.autodiff.variables/Value.__init__",
-        json={
-            "datatype": StrArgument(value="test").model_dump(),
-            "value": FloatArgument(value=1.0).model_dump(),
-        },
+    create_value_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{VALUE_INIT}",
+        json=TEST_VALUE_BODY,
     )
-    assert create_value_response.status_code == status.HTTP_200_OK
+    assert create_value_response.status_code == 200
 
-    # Wait for the session to timeout
-    await asyncio.sleep(0.8)
+    # Let the session timeout
+    registry.clock.tick(11)
+    registry.cleanup_sessions()
 
     # Attempt to use the timed-out session
-    create_timed_out_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{Value.__module__}/{Value.__name__}.__init__",
+    create_timed_out_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{VALUE_INIT}",
         json={
-            "datatype": StrArgument(value="test").model_dump(),
-            "value": FloatArgument(value=2.0).model_dump(),
+            "datatype": TEST_ARG,
+            "value": _arg(ArgumentType.FLOAT, 2.0),
         },
     )
-    assert create_timed_out_response.status_code == status.HTTP_404_NOT_FOUND
+    assert create_timed_out_response.status_code == 404
     assert "Session not found" in create_timed_out_response.json()["detail"]
 
     # Create a new session to test keep_alive
-    create_new_session_response: Response = client.post("/api/sessions")
-    assert create_new_session_response.status_code == status.HTTP_200_OK
-    create_new_session_obj = CreateSessionResponse(**create_new_session_response.json())
-    new_session_id = create_new_session_obj.session_id
+    create_new_session_response = await client.post("/api/sessions")
+    assert create_new_session_response.status_code == 200
+    new_session_id = create_new_session_response.json()["session_id"]
 
-    # Keep the session alive
+    # Keep the session alive past its original timeout
     for _ in range(3):
-        await asyncio.sleep(0.35)
-        keep_alive_response: Response = client.post(
+        registry.clock.tick(7)
+        keep_alive_response = await client.post(
             f"/api/sessions/{new_session_id}/keep_alive",
         )
-        assert keep_alive_response.status_code == status.HTTP_200_OK
+        assert keep_alive_response.status_code == 200
+        registry.cleanup_sessions()
 
     # Verify the session is still active after keep_alive calls
-    create_after_keep_alive_response: Response = client.post(
-        f"/api/sessions/{new_session_id}/resources/{Value.__module__}/{Value.__name__}.__init__",
+    create_after_keep_alive_response = await client.post(
+        f"/api/sessions/{new_session_id}/resources/{VALUE_INIT}",
         json={
-            "datatype": StrArgument(value="test").model_dump(),
-            "value": FloatArgument(value=3.0).model_dump(),
+            "datatype": TEST_ARG,
+            "value": _arg(ArgumentType.FLOAT, 3.0),
         },
     )
-    assert create_after_keep_alive_response.status_code == status.HTTP_200_OK
+    assert create_after_keep_alive_response.status_code == 200
 
 
 @pytest.mark.asyncio
-@pytest.mark.xdist_group(name="node_graph_sequential")
-async def test_list_resources(client):
-    node_graph.configure()
-
-    # Create a session
-    create_session_response: Response = client.post("/api/sessions")
-    assert create_session_response.status_code == status.HTTP_200_OK
-    create_session_obj = CreateSessionResponse(**create_session_response.json())
-    session_id = create_session_obj.session_id
-
-    # Create a Value object
-    create_value_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{Value.__module__}/{Value.__name__}.__init__",
-        json={
-            "datatype": StrArgument(value="Test Value").model_dump(),
-            "value": FloatArgument(value=42.0).model_dump(),
-        },
-    )
-    assert create_value_response.status_code == status.HTTP_200_OK
-    create_value_obj = ResourceResponse(**create_value_response.json())
-
-    # Verify the created Value object
-    assert create_value_obj.data["datatype"] == StrArgument(value="Test Value")
-    assert create_value_obj.data["value"] == FloatArgument(value=42.0)
+@pytest.mark.parametrize("registry", [{}], indirect=True)
+async def test_openapi(client, registry):
+    openapi_response = await client.get("/api/openapi.json")
+    assert openapi_response.status_code == 200
+
+    # The spec is cached on the registry
+    assert registry.openapi_spec == openapi_response.json()
+    cached_openapi_response = await client.get("/api/openapi.json")
+    assert cached_openapi_response.json() == openapi_response.json()
+
+    assert len(registry.skipped_functions) == 0
+
+
+class PonyName(BaseModel):
+    name: str
+
+
+class FakeLLMEngine(AsyncLLMEngine):
+    """
+    LLM engine that returns canned responses for the queries made while
+    backpropagating through extract_pony_name, and fails on any other query.
+    """
+
+    async def query_object(self, response_model, **kwargs):
+        if response_model is PonyName:
+            return PonyName(name="Luna")
+        elif response_model.__name__ == "FeedbackAssignments":
+            return response_model(
+                assignments=[
+                    {
+                        "input_name": "TEXT",
+                        "relevant_feedback": [
+                            "The name should have been Celestia",
+                            "They should have been addressed as Princess",
+                        ],
+                    }
+                ]
+            )
+        elif response_model.__name__ == "UpdatedValue":
+            return response_model(final_value="Hello Princess Celestia.")
+        raise AssertionError(
+            f"unexpected call to query_object for {response_model.__name__}"
+        )
 
-    # List resources
-    list_resources_response: Response = client.get(
-        f"/api/sessions/{session_id}/resources"
-    )
-    assert list_resources_response.status_code == status.HTTP_200_OK
-    list_resources_obj = ListResourcesResponse(**list_resources_response.json())
+    # The tests never make any other kind of query
+    async def query_response(self, **kwargs):
+        raise AssertionError("unexpected call to query_response")
 
-    # Verify that the created Value object is in the list of resources
-    assert len(list_resources_obj.resources) == 1
-    print(list_resources_obj.resources[0])
-    print(create_value_obj)
-    assert list_resources_obj.resources[0] == create_value_obj
+    async def query_stream(self, **kwargs):
+        raise AssertionError("unexpected call to query_stream")
+        yield
 
+    async def query_block(self, block_type, **kwargs):
+        raise AssertionError("unexpected call to query_block")
 
-@pytest.mark.asyncio
-@pytest.mark.xdist_group(name="node_graph_sequential")
-async def test_openapi(client):
-    node_graph.configure()
+    async def query_continuation(self, prompt, **kwargs):
+        raise AssertionError("unexpected call to query_continuation")
 
-    openapi_response: Response = client.get("/api/openapi.json")
-    assert openapi_response.status_code == status.HTTP_200_OK
 
-    assert len(node_graph.skipped_functions) == 0
+@pytest.fixture
+def fake_llm(monkeypatch):
+    # Swap the configured reasoning_llm for a FakeLLMEngine so tests don't load
+    # the LLM config or reach a real model
+    llm = FakeLLMEngine()
+    monkeypatch.setattr("horsona.config._loaded_llms", True)
+    monkeypatch.setitem(llms, "reasoning_llm", llm)
+    return llm
+
+
+@pytest.fixture(
+    params=[
+        pytest.param(False, id="fake_llm"),
+        pytest.param(True, id="live_llm", marks=pytest.mark.live_llm),
+    ]
+)
+def live_llm(request):
+    # Use the fake engine unless the test is explicitly run against the live LLM
+    if not request.param:
+        request.getfixturevalue("fake_llm")
+    return request.param
 
 
 async def extract_pony_name(llm: AsyncLLMEngine, text: Value[str]):
-    from pydantic import BaseModel
-
-    from horsona.autodiff.functions import extract_object
-
-    class PonyName(BaseModel):
-        name: str
-
     return await extract_object(
         llm, PonyName, TEXT=text, TASK="Extract the name from the TEXT."
     )
 
 
 @pytest.mark.asyncio
-@pytest.mark.xdist_group(name="node_graph_sequential")
-async def test_backpropagation(client):
+async def test_backpropagation(client, session_id, live_llm):
     # Test backpropagation through API
-    from horsona.autodiff.basic import HorseVariable
-    from horsona.autodiff.losses import apply_loss
-    from horsona.config import get_llm
-
-    node_graph.configure(extra_modules=[extract_pony_name.__module__])
-
-    # Create a session
-    create_session_response: Response = client.post("/api/sessions")
-    assert create_session_response.status_code == status.HTTP_200_OK
-    create_session_obj = CreateSessionResponse(**create_session_response.json())
-    session_id = create_session_obj.session_id
-
     # Create an LLM engine
-    create_llm_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{get_llm.__module__}/{get_llm.__name__}",
-        json={"name": StrArgument(value="reasoning_llm").model_dump()},
+    create_llm_response = await client.post(
+        f"/api/sessions/{session_id}/resources/{GET_LLM}",
+        json=REASONING_LLM_BODY,
     )
-    assert create_llm_response.status_code == status.HTTP_200_OK
-    create_llm_obj = ResourceResponse(**create_llm_response.json())
-
-    # Create input text Value
-    create_text_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{Value.__module__}/{Value.__name__}.__init__",
-        json={
-            "datatype": StrArgument(value="Story dialogue").model_dump(),
-            "value": StrArgument(value="Hello Luna.").model_dump(),
-            "llm": create_llm_obj.result.model_dump(),
-        },
-    )
-    assert create_text_response.status_code == status.HTTP_200_OK
-    create_text_obj = ResourceResponse(**create_text_response.json())
-
-    # Get the pony's name
-    extract_name_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{extract_pony_name.__module__}/{extract_pony_name.__name__}",
-        json={
-            "llm": create_llm_obj.result.model_dump(),
-            "text": create_text_obj.result.model_dump(),
-        },
-    )
-    assert (
-        extract_name_response.status_code == status.HTTP_200_OK
-    ), extract_name_response.json()
-    extract_name_obj = ResourceResponse(**extract_name_response.json())
-
-    # Create first loss
-    loss1_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{apply_loss.__module__}/{apply_loss.__name__}",
-        json={
-            "arg": extract_name_obj.result.model_dump(),
-            "loss": StrArgument(
-                value="The name should have been Celestia"
-            ).model_dump(),
-        },
-    )
-    assert loss1_response.status_code == status.HTTP_200_OK
-    loss1_obj = ResourceResponse(**loss1_response.json())
-
-    # Create second loss
-    loss2_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{apply_loss.__module__}/{apply_loss.__name__}",
-        json={
-            "arg": extract_name_obj.result.model_dump(),
-            "loss": StrArgument(
-                value="They should have been addressed as Princess [...]",
-            ).model_dump(),
-        },
-    )
-    assert loss2_response.status_code == status.HTTP_200_OK
-    loss2_obj = ResourceResponse(**loss2_response.json())
-
-    # Add losses
-    add_loss_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{HorseVariable.__module__}/{HorseVariable.__name__}.__add__",
-        json={
-            "self": loss1_obj.result.model_dump(),
-            "other": loss2_obj.result.model_dump(),
-        },
-    )
-    assert add_loss_response.status_code == status.HTTP_200_OK
-    add_loss_obj = ResourceResponse(**add_loss_response.json())
-
-    # Apply backpropagation
-    step_response: Response = client.post(
-        f"/api/sessions/{session_id}/resources/{HorseVariable.__module__}/{HorseVariable.__name__}.step",
+    assert create_llm_response.status_code == 200
+    create_llm_data = create_llm_response.json()
+
+    # Create the input text, extract the name, apply both losses, and step in
+    # one batch. Items refer to earlier results as "@<index>", and the two
+    # independent losses are applied concurrently.
+    batch_response = await client.post(
+        f"/api/sessions/{session_id}/resources:batch",
         json={
-            "self": add_loss_obj.result.model_dump(),
-            "params": ListArgument(
-                value=[create_text_obj.result.model_dump()],
-            ).model_dump(),
+            "concurrent": True,
+            "items": [
+                {
+                    "module_name": Value.__module__,
+                    "function_name": f"{Value.__name__}.__init__",
+                    "kwargs": {
+                        "datatype": _arg(ArgumentType.STR, "Story dialogue"),
+                        "value": _arg(ArgumentType.STR, "Hello Luna."),
+                        "llm": create_llm_data["result"],
+                    },
+                },
+                {
+                    "module_name": extract_pony_name.__module__,
+                    "function_name": extract_pony_name.__name__,
+                    "kwargs": {"llm": create_llm_data["result"], "text": "@0"},
+                },
+                {
+                    "module_name": apply_loss.__module__,
+                    "function_name": apply_loss.__name__,
+                    "kwargs": {
+                        "arg": "@1",
+                        "loss": _arg(
+                            ArgumentType.STR, "The name should have been Celestia"
+                        ),
+                    },
+                },
+                {
+                    "module_name": apply_loss.__module__,
+                    "function_name": apply_loss.__name__,
+                    "kwargs": {
+                        "arg": "@1",
+                        "loss": _arg(
+                            ArgumentType.STR,
+                            "They should have been addressed as Princess [...]",
+                        ),
+                    },
+                },
+                {
+                    "module_name": HorseVariable.__module__,
+                    "function_name": f"{HorseVariable.__name__}.__add__",
+                    "kwargs": {"self": "@2", "other": "@3"},
+                },
+                {
+                    "module_name": HorseVariable.__module__,
+                    "function_name": f"{HorseVariable.__name__}.step",
+                    "kwargs": {"self": "@4", "params": _arg(ArgumentType.LIST, ["@0"])},
+                },
+            ],
         },
     )
-    assert step_response.status_code == status.HTTP_200_OK
+    assert batch_response.status_code == 200, batch_response.json()
+    text_id = batch_response.json()["results"][0]["result"]["value"]
 
     # Verify the text was updated
-    get_text_response: Response = client.get(
-        f"/api/sessions/{session_id}/resources/{create_text_obj.result.value}"
+    get_text_response = await client.get(
+        f"/api/sessions/{session_id}/resources/{text_id}"
     )
-    assert get_text_response.status_code == status.HTTP_200_OK
-    get_text_obj = ResourceResponse(**get_text_response.json())
-    print(get_text_obj)
-    assert get_text_obj.data["value"] == StrArgument(value="Hello Princess Celestia.")
+    assert get_text_response.status_code == 200
+    get_text_data = get_text_response.json()
+    assert get_text_data["data"]["value"]["value"] == "Hello Princess Celestia."
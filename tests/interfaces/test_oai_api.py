@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import socket
 
 import pytest
 import uvicorn
@@ -9,14 +10,36 @@ from openai import AsyncOpenAI
 from horsona.interface import oai
 
 
-@pytest.fixture
+class NotifyingServer(uvicorn.Server):
+    """
+    Uvicorn server that sets an event once startup finishes, whether or not it
+    succeeded, so waiters never hang on a failed startup.
+    """
+
+    def __init__(self, config: uvicorn.Config):
+        super().__init__(config)
+        self.startup_done = asyncio.Event()
+
+    async def startup(self, sockets=None):
+        try:
+            await super().startup(sockets=sockets)
+        finally:
+            self.startup_done.set()
+
+
+@pytest.fixture(scope="session")
 async def oai_server(reasoning_llm):
     app = FastAPI()
     app.include_router(oai.api_router)
     oai.add_llm_engine(reasoning_llm, name="reasoning_llm")
 
-    config = uvicorn.Config(app, host="127.0.0.1", port=8002)
-    server = uvicorn.Server(config)
+    # Bind to a free port up front so the URL is known before the server starts
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(("127.0.0.1", 0))
+    host, port = sock.getsockname()
+
+    config = uvicorn.Config(app)
+    server = NotifyingServer(config)
 
     # Temporarily suppress logging
     uvicorn_error_level = logging.getLogger("uvicorn.error").getEffectiveLevel()
@@ -29,32 +52,37 @@ async def oai_server(reasoning_llm):
     logging.getLogger("uvicorn.asgi").setLevel(logging.CRITICAL)
     logging.getLogger("fastapi").setLevel(logging.CRITICAL)
     # Start the server and wait for it to be ready
-    server_task = asyncio.create_task(server.serve())
-    while not server.started:
-        await asyncio.sleep(0.1)
+    server_task = asyncio.create_task(server.serve(sockets=[sock]))
+    await server.startup_done.wait()
+    assert server.started
 
-    yield
+    yield f"http://{host}:{port}/api/v1"
 
     # Stop the server and wait for it to exit
     server.should_exit = True
-    while not server_task.done():
-        await asyncio.sleep(0.1)
+    await server_task
 
     # Restore logging
     logging.getLogger("uvicorn.error").setLevel(uvicorn_error_level)
     logging.getLogger("uvicorn.access").setLevel(uvicorn_access_level)
     logging.getLogger("uvicorn.asgi").setLevel(uvicorn_asgi_level)
     logging.getLogger("fastapi").setLevel(fastapi_level)
+    sock.close()
 
 
-@pytest.mark.asyncio
-async def test_chat_completion(oai_server):
-    # Initialize client pointing to local server
-    oai_client = AsyncOpenAI(
-        base_url="http://127.0.0.1:8002/api/v1",
+@pytest.fixture(scope="session")
+async def oai_client(oai_server):
+    # Share one client so its connection pool is reused across tests
+    client = AsyncOpenAI(
+        base_url=oai_server,
         api_key="not-needed",  # API key not needed for local server
     )
+    yield client
+    await client.close()
 
+
+@pytest.mark.asyncio
+async def test_chat_completion(oai_client):
     # Send chat completion request
     response = await oai_client.chat.completions.create(
         model="reasoning_llm",  # Use the reasoning_llm model
@@ -75,13 +103,7 @@ async def test_chat_completion(oai_server):
 
 
 @pytest.mark.asyncio
-async def test_chat_completion_stream(oai_server):
-    # Initialize client pointing to local server
-    oai_client = AsyncOpenAI(
-        base_url="http://127.0.0.1:8002/api/v1",
-        api_key="not-needed",  # API key not needed for local server
-    )
-
+async def test_chat_completion_stream(oai_client):
     # Send streaming chat completion request
     stream = await oai_client.chat.completions.create(
         model="reasoning_llm",
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+from pydantic import BaseModel
+
+from horsona import config
+from horsona.llm.base_engine import AsyncLLMEngine
+from horsona.llm.cached_engine import CachedLLMEngine
+
+
+class Greeting(BaseModel):
+    text: str
+
+
+class CountingLLMEngine(AsyncLLMEngine):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = 0
+
+    async def query_response(self, **kwargs):
+        self.calls += 1
+        return f"response {self.calls}"
+
+    async def query_stream(self, **kwargs):
+        self.calls += 1
+        for chunk in ["stream ", str(self.calls)]:
+            yield chunk
+
+    async def query_object(self, response_model, **kwargs):
+        self.calls += 1
+        return response_model(text=f"object {self.calls}")
+
+    async def query_block(self, block_type, **kwargs):
+        self.calls += 1
+        return f"block {self.calls}"
+
+    async def query_continuation(self, prompt, **kwargs):
+        self.calls += 1
+        return f"continuation {self.calls}"
+
+
+@pytest.mark.asyncio
+async def test_cached_engine(tmp_path):
+    underlying_llm = CountingLLMEngine()
+    cached_llm = CachedLLMEngine(underlying_llm, str(tmp_path))
+
+    first = await cached_llm.query_object(Greeting, TASK="say hello")
+    assert first == Greeting(text="object 1")
+
+    # Repeated queries are served from the cache
+    assert await cached_llm.query_object(Greeting, TASK="say hello") == first
+    assert underlying_llm.calls == 1
+
+    # Different prompts and query types go to the underlying engine
+    assert await cached_llm.query_object(Greeting, TASK="say goodbye") == Greeting(
+        text="object 2"
+    )
+    assert await cached_llm.query_block("text", TASK="say hello") == "block 3"
+    assert underlying_llm.calls == 3
+
+    # The cache persists across engine instances
+    reloaded_llm = CachedLLMEngine(CountingLLMEngine(), str(tmp_path))
+    assert await reloaded_llm.query_block("text", TASK="say hello") == "block 3"
+
+    # Streaming queries always go to the underlying engine
+    for expected in ["stream 4", "stream 5"]:
+        chunks = [chunk async for chunk in cached_llm.query_stream(TASK="say hello")]
+        assert "".join(chunks) == expected
+
+
+def test_load_llms_caches_composite_engines(tmp_path, monkeypatch):
+    llm_config = [
+        {"base_llm": {"type": "AsyncOpenAIEngine", "model": "gpt-4o-mini"}},
+        {"multi_llm": {"type": "MultiEngine", "engines": ["base_llm"]}},
+        {"reference_llm": {"type": "ReferenceEngine", "reference": "base_llm"}},
+    ]
+    (tmp_path / "llm_config.json").write_text(json.dumps(llm_config))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENAI_API_KEY", "unused")
+    monkeypatch.setenv("HORSONA_LLM_CACHE", "1")
+    monkeypatch.setattr(config, "llms", {})
+    monkeypatch.setattr(config, "_loaded_llms", False)
+
+    llms = config.load_llms()
+
+    # Composite engines are built from the cached engine, not the raw one
+    assert isinstance(llms["base_llm"], CachedLLMEngine)
+    assert llms["multi_llm"].engines == (llms["base_llm"],)
+    assert llms["reference_llm"] is llms["base_llm"]
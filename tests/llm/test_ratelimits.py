@@ -1,3 +1,4 @@
+import asyncio
 import time
 
 import pytest
@@ -14,18 +15,18 @@ async def test_call_limit():
         ]
     )
 
-    start = time.time()
+    start = time.monotonic()
 
     # Should take no time to reach the limits
     await limits.consume_call()
-    assert time.time() - start < 0.05
+    assert time.monotonic() - start < 0.05
     await limits.consume_call()
     await limits.consume_call()
-    assert time.time() - start >= 0.2
+    assert time.monotonic() - start >= 0.2
 
     await limits.consume_call()
-    assert time.time() - start > 0.4
-    assert time.time() - start < 0.5
+    assert time.monotonic() - start > 0.4
+    assert time.monotonic() - start < 0.5
 
 
 @pytest.mark.asyncio
@@ -37,12 +38,29 @@ async def test_token_limit():
         ]
     )
 
-    start = time.time()
+    start = time.monotonic()
 
     for i in range(5):
-        await limits.wait_for(9)
-        limits.report_tokens_consumed(9)
+        await limits.acquire(9)
     await limits.wait_for(1)
 
-    assert time.time() - start > 1.5
-    assert time.time() - start < 1.8
+    assert time.monotonic() - start > 1.5
+    assert time.monotonic() - start < 1.8
+
+
+@pytest.mark.asyncio
+async def test_concurrent_token_acquire():
+    limits = RateLimits([{"interval": 0.3, "max_calls": 100, "max_tokens": 9}])
+
+    start = time.monotonic()
+
+    async def acquire():
+        await limits.acquire(9)
+        return time.monotonic() - start
+
+    # Concurrent callers must be spaced out as if they ran one after another.
+    # Only lower bounds are checked since a loaded machine can delay any caller.
+    finish_times = sorted(await asyncio.gather(*[acquire() for _ in range(3)]))
+
+    assert finish_times[1] > 0.55
+    assert finish_times[2] > 0.85
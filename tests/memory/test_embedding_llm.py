@@ -18,9 +18,9 @@ SAMPLE_DATA = {
 }
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 async def embedding_llm(reasoning_llm, query_index):
-    print("Using reasoning llm:", reasoning_llm)
+    # The tests only read from the database, so SAMPLE_DATA is embedded once
     database = EmbeddingDatabase(reasoning_llm, query_index)
     await database.insert(SAMPLE_DATA)
     return EmbeddingLLMEngine(
@@ -35,8 +35,6 @@ async def test_query_block(embedding_llm):
         TASK="What is James doing with the camera?",
     )
 
-    print(response)
-
     assert isinstance(response, str)
     assert "faces" in response
 
@@ -51,8 +49,6 @@ async def test_query_object(embedding_llm):
         TASK="What color is Honeycrisp?",
     )
 
-    print(response)
-
     assert isinstance(response, Response)
     assert response.color.lower() == "red"
 
@@ -74,7 +70,5 @@ async def test_query_with_context(embedding_llm):
         TASK="What does the monitor have attached to it?",
     )
 
-    print(response)
-
     assert isinstance(response, str)
     assert "webcam" in response.lower()
@@ -75,22 +75,14 @@ from horsona.llm.base_engine import AsyncLLMEngine
 from horsona.memory.gist_module import GistModule, paginate
 from horsona.memory.readagent_llm import ReadAgentLLMEngine
 
-_readagent_llm = None
 
-
-@pytest.fixture
+@pytest.fixture(scope="module")
 async def readagent_llm(reasoning_llm):
-    global _readagent_llm
-
-    if _readagent_llm is not None:
-        return _readagent_llm
-
     gist_module = GistModule(reasoning_llm)
     for page in paginate(STORY_TEXT, max_chars_per_page=1500):
         await gist_module.append(Value("Story text", page))
 
-    _readagent_llm = ReadAgentLLMEngine(reasoning_llm, gist_module, max_pages=2)
-    return _readagent_llm
+    return ReadAgentLLMEngine(reasoning_llm, gist_module, max_pages=2)
 
 
 @pytest.mark.asyncio